@@ -45,6 +45,12 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 # Configure file uploads
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['RECEIPT_CACHE_DIR'] = os.path.join('uploads', 'receipts')  # Generated receipt PDFs
+
+# Let the front-end server stream uploaded images instead of a worker:
+# USE_X_SENDFILE for Apache/lighttpd, X_ACCEL_REDIRECT_PREFIX for an nginx internal location
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', 'false').lower() in ['true', 'on', '1']
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.environ.get('X_ACCEL_REDIRECT_PREFIX')
 
 # Configure mail
 app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
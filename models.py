@@ -1,8 +1,30 @@
 from datetime import datetime
+from decimal import Decimal
 from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import func
+from sqlalchemy import and_, case, func
+from sqlalchemy.ext.hybrid import hybrid_property
+
+# Permissions granted to each role, built once at import
+ROLE_PERMISSIONS = {
+    'office_admin': frozenset([
+        'manage_users', 'view_all', 'reconcile_payments', 'manage_inventory', 
+        'create_sales', 'view_inventory', 'view_sales', 'edit_inventory', 
+        'delete_inventory', 'edit_sales', 'delete_sales', 'manage_customers',
+        'view_customers', 'edit_customers', 'delete_customers', 'manage_files',
+        'view_files', 'edit_files', 'delete_files', 'generate_reports',
+        'export_data', 'import_data', 'system_settings', 'view_reports'
+    ]),
+    'sales_staff': frozenset([
+        'create_sales', 'view_inventory', 'view_sales', 'manage_customers',
+        'view_customers', 'edit_customers', 'view_files', 'view_reports'
+    ]),
+    'intake_staff': frozenset([
+        'manage_inventory', 'view_inventory', 'edit_inventory', 
+        'manage_files', 'view_files', 'edit_files'
+    ])
+}
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -25,25 +47,7 @@ class User(UserMixin, db.Model):
 
     def has_permission(self, permission):
         """Check if user has specific permission based on role"""
-        permissions = {
-            'office_admin': [
-                'manage_users', 'view_all', 'reconcile_payments', 'manage_inventory', 
-                'create_sales', 'view_inventory', 'view_sales', 'edit_inventory', 
-                'delete_inventory', 'edit_sales', 'delete_sales', 'manage_customers',
-                'view_customers', 'edit_customers', 'delete_customers', 'manage_files',
-                'view_files', 'edit_files', 'delete_files', 'generate_reports',
-                'export_data', 'import_data', 'system_settings', 'view_reports'
-            ],
-            'sales_staff': [
-                'create_sales', 'view_inventory', 'view_sales', 'manage_customers',
-                'view_customers', 'edit_customers', 'view_files', 'view_reports'
-            ],
-            'intake_staff': [
-                'manage_inventory', 'view_inventory', 'edit_inventory', 
-                'manage_files', 'view_files', 'edit_files'
-            ]
-        }
-        return permission in permissions.get(self.role, [])
+        return permission in ROLE_PERMISSIONS.get(self.role, frozenset())
 
 class InventoryItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -63,6 +67,22 @@ class InventoryItem(db.Model):
     # Relationships
     files = db.relationship('InventoryFile', backref='inventory_item', lazy=True, cascade='all, delete-orphan')
     sales = db.relationship('Sale', backref='inventory_item', lazy=True)
+    
+    @hybrid_property
+    def net_profit(self):
+        """Per-unit profit after 30% overhead on the selling price; 0 unless both prices are set"""
+        if not (self.selling_price and self.purchase_cost):
+            return 0.0
+        selling = float(self.selling_price)
+        return (selling - float(self.purchase_cost)) - selling * 0.3
+    
+    @net_profit.expression
+    def net_profit(cls):
+        return case(
+            (and_(cls.selling_price != 0, cls.purchase_cost != 0),
+             cls.selling_price - cls.purchase_cost - cls.selling_price * Decimal('0.3')),
+            else_=0
+        )
 
 class InventoryFile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -75,7 +95,7 @@ class InventoryFile(db.Model):
 
 class Customer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)  # Looked up by name on quick sales/inquiries
     email = db.Column(db.String(120))
     phone = db.Column(db.String(20))
     password_hash = db.Column(db.String(256))  # For customer accounts
@@ -135,6 +155,13 @@ class Sale(db.Model):
     sale_price = db.Column(db.Numeric(10, 2), nullable=True)
     discount_percentage = db.Column(db.Numeric(5, 2), default=0)
     final_price = db.Column(db.Numeric(10, 2), nullable=True)
+    
+    # Customer history, the admin "has sales" checks and report date ranges filter on these
+    __table_args__ = (
+        db.Index('ix_sale_customer_date', 'customer_id', 'sale_date'),
+        db.Index('ix_sale_inventory', 'inventory_id'),
+        db.Index('ix_sale_date', 'sale_date'),
+    )
 
     def generate_invoice_number(self):
         """Generate unique invoice number"""
@@ -181,11 +208,17 @@ class SaleItem(db.Model):
     # Relationship
     inventory_item = db.relationship('InventoryItem', backref='sale_items', lazy='select')
     
+    @staticmethod
+    def compute_line_totals(quantity_sold, unit_price, discount_percentage):
+        """Return (line_total, discount_amount, final_line_total) for a line"""
+        line_total = quantity_sold * unit_price
+        discount_amount = (line_total * discount_percentage) / 100
+        return line_total, discount_amount, line_total - discount_amount
+    
     def calculate_line_totals(self):
         """Calculate line totals based on quantity and discounts"""
-        self.line_total = self.quantity_sold * self.unit_price
-        self.discount_amount = (self.line_total * self.discount_percentage) / 100
-        self.final_line_total = self.line_total - self.discount_amount
+        self.line_total, self.discount_amount, self.final_line_total = SaleItem.compute_line_totals(
+            self.quantity_sold, self.unit_price, self.discount_percentage)
 
 class AuditLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -3,6 +3,8 @@ Simple receipt generator for sales with customer sharing options
 """
 
 import os
+import glob
+import hashlib
 from datetime import datetime
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.units import mm
@@ -13,17 +15,47 @@ from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 
 
-def create_sale_receipt(sale, customer, inventory_item, quantity_sold, format_type='standard'):
+def receipt_cache_path(sale, customer, format_type, cache_dir):
+    """
+    Get the on-disk path a generated receipt is cached under
+    Everything the receipt prints that can be edited after the sale (customer details,
+    payment fields, totals and the live inventory item names and prices) feeds the
+    fingerprint in the name, so any edit produces a new file.
+    """
+    if sale.inventory_item:
+        item_fields = (sale.inventory_item.item_type, sale.inventory_item.selling_price)
+    else:
+        item_fields = tuple(
+            (sale_item.inventory_item.item_type if sale_item.inventory_item else None,
+             sale_item.quantity_sold, sale_item.unit_price, sale_item.final_line_total)
+            for sale_item in sale.sale_items
+        )
+    printed_fields = (customer.name, customer.email, customer.phone,
+                      sale.invoice_number, sale.sale_date, sale.payment_method, sale.payment_receiver,
+                      sale.quantity_sold, sale.sale_price, sale.discount_percentage, sale.final_price,
+                      sale.total_discount_amount, sale.final_total_price, item_fields)
+    fingerprint = hashlib.sha1(repr(printed_fields).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_dir, f"receipt_{sale.id}_{format_type}_{fingerprint}.pdf")
+
+
+def cached_receipt_paths(sale_id, cache_dir, format_type='*'):
+    """Cached receipt PDFs on disk for a sale, optionally limited to one format"""
+    return glob.glob(os.path.join(cache_dir, f"receipt_{sale_id}_{format_type}_*.pdf"))
+
+
+def create_sale_receipt(sale, customer, inventory_item, quantity_sold, format_type='standard', filepath=None):
     """
     Create a sale receipt PDF with as-is disclaimer
     format_type: 'standard' for regular letter size, 'thermal' for 80mm thermal paper
+    filepath: where to write the PDF, defaults to uploads/receipt_<invoice>.pdf
     """
-    format_suffix = "_thermal" if format_type == 'thermal' else ""
-    filename = f"receipt_{sale.invoice_number}{format_suffix}.pdf"
-    filepath = os.path.join('uploads', filename)
+    if filepath is None:
+        format_suffix = "_thermal" if format_type == 'thermal' else ""
+        filename = f"receipt_{sale.invoice_number}{format_suffix}.pdf"
+        filepath = os.path.join('uploads', filename)
     
-    # Ensure uploads directory exists
-    os.makedirs('uploads', exist_ok=True)
+    # Ensure output directory exists
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
     
     print(f"Creating receipt: {filepath} (format: {format_type})")
     print(f"Sale items count: {len(sale.sale_items) if sale.sale_items else 0}")
@@ -1,26 +1,89 @@
 import os
+import re
+import csv
+import io
 import uuid
-from datetime import datetime
-from decimal import Decimal
-from flask import render_template, request, redirect, url_for, flash, send_file, send_from_directory, jsonify, make_response, session, abort
+from functools import lru_cache
+from itertools import islice
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from flask import render_template, request, redirect, url_for, flash, send_file, send_from_directory, jsonify, make_response, session, abort, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
+from sqlalchemy import case, func, insert, update
+from sqlalchemy.orm import joinedload, selectinload
 from werkzeug.security import generate_password_hash
 from flask_mail import Message
 import json
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib import colors
+from reportlab.lib.units import inch
 
 from app import app, db, login_manager, mail
 from models import User, InventoryItem, InventoryFile, Customer, Sale, SaleItem, AuditLog
 from forms import LoginForm, RegisterForm, InventoryForm, SaleForm, CustomerForm, EditCustomerForm, PaymentConfirmationForm, CustomerLoginForm, CustomerRegisterForm
 from multi_item_forms import MultiItemSaleForm, EditSaleForm, VoidSaleForm
-from utils import allowed_file, log_action, send_email_notification, calculate_business_profit, calculate_actual_discount_percentage
-from template_helpers import safe_calculate_totals
-from receipt_generator import create_sale_receipt
+from utils import allowed_file, log_action, unlink_quiet, batch_unlink, send_email_notification, calculate_business_profit, calculate_actual_discount_percentage, cached_report_data
+from utils import get_file_icon, get_payment_status_badge_class, get_role_display_name
+from template_helpers import sql_totals
+from receipt_generator import create_sale_receipt, receipt_cache_path, cached_receipt_paths
 from barcode_scanner import ProductLookupService
 from ai_product_identifier import identify_product_from_image, analyze_product_for_recycling
 from pdf_generator import create_product_flyer, create_simple_product_image
 from utils import allowed_file
 
+# Lookup-table helpers exposed to templates as filters, e.g. {{ sale.payment_status|payment_badge_class }}
+app.add_template_filter(get_file_icon, 'file_icon')
+app.add_template_filter(get_payment_status_badge_class, 'payment_badge_class')
+app.add_template_filter(get_role_display_name, 'role_display_name')
+
+# The logo only changes between deploys, so resolve it once at import
+_LOGO_CANDIDATES = (
+    os.path.join(app.static_folder, 'images', 'revibe-logo.png'),
+    os.path.join(app.static_folder, 'images', 'ReVibe Logo.png'),
+)
+LOGO_PATH = next((path for path in _LOGO_CANDIDATES if os.path.exists(path)), None)
+
+# Extensions served back out of the uploads directory
+UPLOAD_SERVE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.pdf', '.mp4', '.avi', '.mov'})
+PUBLIC_IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.gif'})
+
+# Multi-item sale form keys: sale_items-INDEX-FIELD (current) and sale_items[INDEX][FIELD] (legacy)
+SALE_ITEM_KEY_RE = re.compile(r'sale_items-([^-]+)-(.+)')
+LEGACY_SALE_ITEM_KEY_RE = re.compile(r'sale_items\[([^\]]+)\]\[([^\]]+)\]')
+
+DECIMAL_ZERO = Decimal('0')
+
+# CSV exports are fetched and streamed in batches rather than built in memory
+CSV_EXPORT_BATCH_SIZE = 1000
+
+# Uploaded files get unique names, so clients can cache them for a week
+STATIC_MAX_AGE = 7 * 24 * 60 * 60
+
+def send_upload(file_path, mimetype):
+    """Send an uploaded file, handing the transfer to the front-end server when configured"""
+    accel_prefix = app.config.get('X_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        relative_path = os.path.relpath(file_path, app.config['UPLOAD_FOLDER'])
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{relative_path}"
+        response.headers['Content-Type'] = mimetype
+        return response
+    # send_file emits X-Sendfile itself when USE_X_SENDFILE is enabled
+    return send_file(file_path, mimetype=mimetype)
+
+def sale_report_options():
+    """Loader options for the Sale relationships that report rows render"""
+    # All many-to-one, so they ride along on the main SELECT as outer joins
+    return (
+        joinedload(Sale.customer),
+        joinedload(Sale.inventory_item),
+        joinedload(Sale.sold_by_user),
+        joinedload(Sale.payment_confirmed_by_user),
+    )
+
 @app.route('/shop')
 def public_storefront():
     """Public storefront for customers to browse and inquire about items"""
@@ -179,7 +242,7 @@ def login():
         user = User.query.filter_by(username=form.username.data).first()
         if user and user.check_password(form.password.data) and user.is_active:
             login_user(user, remember=form.remember_me.data)
-            log_action('login', 'user', user.id, request.remote_addr)
+            log_action('login', 'user', user.id, request.remote_addr, autocommit=True)
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else redirect(url_for('dashboard'))
         flash('Invalid username or password', 'danger')
@@ -202,7 +265,7 @@ def register():
         db.session.add(user)
         db.session.commit()
         
-        log_action('create', 'user', user.id, request.remote_addr)
+        log_action('create', 'user', user.id, request.remote_addr, autocommit=True)
         flash('User created successfully', 'success')
         return redirect(url_for('user_management'))
     
@@ -211,7 +274,7 @@ def register():
 @app.route('/logout')
 @login_required
 def logout():
-    log_action('logout', 'user', current_user.id, request.remote_addr)
+    log_action('logout', 'user', current_user.id, request.remote_addr, autocommit=True)
     logout_user()
     return redirect(url_for('login'))
 
@@ -250,23 +313,8 @@ def inventory():
     items = query.order_by(InventoryItem.date_added.desc()).paginate(
         page=page, per_page=20, error_out=False)
     
-    # Calculate totals safely in Python
-    all_items = query.all()
-    totals = {
-        'total_quantity': sum((item.quantity or 1) for item in all_items),
-        'total_investment': sum(float(item.purchase_cost or 0) * (item.quantity or 1) for item in all_items),
-        'total_revenue': sum(float(item.selling_price or 0) * (item.quantity or 1) for item in all_items),
-        'total_net_profit': 0
-    }
-    
-    for item in all_items:
-        if item.selling_price and item.purchase_cost:
-            selling = float(item.selling_price)
-            purchase = float(item.purchase_cost)
-            gross = selling - purchase
-            overhead = selling * 0.3
-            net_per_item = gross - overhead
-            totals['total_net_profit'] += net_per_item * (item.quantity or 1)
+    # Totals are summed by the database, so no item rows are transferred
+    totals = sql_totals(query)
     
     return render_template('inventory.html', items=items, status_filter=status_filter, totals=totals)
 
@@ -408,10 +456,10 @@ def edit_inventory(item_id):
     
     # Commit all changes together (item + files)
     try:
-        db.session.commit()
-        app.logger.info("Database changes committed successfully")
         log_action('update', 'inventory_item', item.id, request.remote_addr, 
                    json.dumps(old_values), json.dumps(new_values))
+        db.session.commit()
+        app.logger.info("Database changes committed successfully")
         
         files_uploaded = len([f for f in uploaded_files if f and f.filename])
         if files_uploaded > 0:
@@ -438,15 +486,14 @@ def delete_file(file_id):
     file = InventoryFile.query.get_or_404(file_id)
     
     try:
-        # Delete physical file
-        if os.path.exists(file.file_path):
-            os.remove(file.file_path)
-        
         # Delete database record
+        file_path = file.file_path
         db.session.delete(file)
+        log_action('delete', 'inventory_file', file_id, request.remote_addr)
         db.session.commit()
         
-        log_action('delete', 'inventory_file', file_id, request.remote_addr)
+        # Delete physical file once the record is gone
+        unlink_quiet(file_path)
         
         return jsonify({'success': True, 'message': 'File deleted successfully'})
     except Exception as e:
@@ -509,7 +556,7 @@ def add_inventory():
                     db.session.add(inventory_file)
             
             db.session.commit()
-            log_action('create', 'inventory_item', item.id, request.remote_addr)
+            log_action('create', 'inventory_item', item.id, request.remote_addr, autocommit=True)
             flash('Inventory item added successfully', 'success')
             return redirect(url_for('inventory'))
         except Exception as e:
@@ -525,7 +572,7 @@ def add_inventory():
         page=page, per_page=20, error_out=False)
     
     # Calculate totals for the dashboard
-    totals = safe_calculate_totals(query.all())
+    totals = sql_totals(query)
     
     return render_template('inventory.html', form=form, add_mode=True, items=items, status_filter=status_filter, totals=totals)
 
@@ -639,7 +686,8 @@ def ai_photo_analysis():
 def get_available_inventory():
     """Get available inventory items as JSON for multi-item sales"""
     try:
-        items = InventoryItem.query.filter_by(status='available').order_by(InventoryItem.item_type).all()
+        items = InventoryItem.query.options(selectinload(InventoryItem.files))\
+            .filter_by(status='available').order_by(InventoryItem.item_type).all()
         
         items_data = []
         for item in items:
@@ -654,11 +702,13 @@ def get_available_inventory():
                 'image_url': None
             }
             
-            # Add first image if available and file exists
+            # Add first image if available and file exists. The item is already known to be
+            # available and the file a photo, so link the filename route directly and skip
+            # the per-thumbnail InventoryFile lookup done by the file_id route.
             if item.files:
                 first_image = next((f for f in item.files if f.file_type == 'photo'), None)
                 if first_image and os.path.exists(first_image.file_path):
-                    item_data['image_url'] = url_for('public_image', file_id=first_image.id)
+                    item_data['image_url'] = url_for('serve_image_by_filename', filename=first_image.filename)
             
             items_data.append(item_data)
         
@@ -744,18 +794,18 @@ def add_sale():
             return redirect(url_for('sales'))
         
         # Calculate final price based on quantity
-        unit_price = float(inventory_item.selling_price or 0)
+        unit_price = inventory_item.selling_price or Decimal('0')
         subtotal = unit_price * quantity_to_sell
-        discount_pct = float(form.discount_percentage.data or 0)
-        final_price = subtotal * (1 - discount_pct / 100)
+        discount_pct = form.discount_percentage.data or Decimal('0')
+        final_price = (subtotal * (100 - discount_pct) / 100).quantize(Decimal('0.01'))
         
         sale = Sale()
         sale.customer_id = customer.id
         sale.inventory_id = form.inventory_id.data
         sale.quantity_sold = quantity_to_sell
-        sale.sale_price = Decimal(str(subtotal))
+        sale.sale_price = subtotal
         sale.discount_percentage = form.discount_percentage.data
-        sale.final_price = Decimal(str(final_price))
+        sale.final_price = final_price
         sale.payment_method = form.payment_method.data
         sale.payment_receiver = form.payment_receiver.data
         sale.notes = form.notes.data
@@ -772,7 +822,7 @@ def add_sale():
         db.session.add(sale)
         db.session.commit()
         
-        log_action('create', 'sale', sale.id, request.remote_addr)
+        log_action('create', 'sale', sale.id, request.remote_addr, autocommit=True)
         flash('Sale created successfully', 'success')
         return redirect(url_for('sales'))
     
@@ -898,16 +948,14 @@ def history():
     # Apply date filters
     if date_from:
         try:
-            from datetime import datetime
-            date_from_obj = datetime.strptime(date_from, '%Y-%m-%d')
+            date_from_obj = datetime.fromisoformat(date_from)
             query = query.filter(Sale.sale_date >= date_from_obj)
         except ValueError:
             pass
     
     if date_to:
         try:
-            from datetime import datetime, timedelta
-            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
+            date_to_obj = datetime.fromisoformat(date_to) + timedelta(days=1)
             query = query.filter(Sale.sale_date < date_to_obj)
         except ValueError:
             pass
@@ -972,12 +1020,11 @@ def confirm_payment(sale_id):
             else:
                 sale.notes = confirmation_note.strip()
         
-        db.session.commit()
-        
         # Log the action
         log_action('confirm_payment', 'sale', sale_id, request.remote_addr,
                    old_values={'payment_status': old_status},
                    new_values={'payment_status': 'received', 'confirmed_by': current_user.username})
+        db.session.commit()
         
         flash(f'Payment confirmed for Invoice #{sale.invoice_number}!', 'success')
         return redirect(url_for('reconciliation'))
@@ -1036,11 +1083,10 @@ def toggle_user_status(user_id):
     
     old_status = user.is_active
     user.is_active = not user.is_active
-    db.session.commit()
-    
     log_action('update', 'user', user.id, request.remote_addr,
                old_values={'is_active': old_status},
                new_values={'is_active': user.is_active})
+    db.session.commit()
     
     status = 'activated' if user.is_active else 'deactivated'
     flash(f'User {status} successfully', 'success')
@@ -1123,10 +1169,6 @@ def public_image(file_id):
             app.logger.error(f"File not found: {file_record.file_path}")
             abort(404)
         
-        # Read file content directly
-        with open(file_record.file_path, 'rb') as f:
-            file_content = f.read()
-        
         # Determine proper MIME type based on file extension
         filename_lower = file_record.filename.lower()
         if filename_lower.endswith(('.jpg', '.jpeg')):
@@ -1138,14 +1180,11 @@ def public_image(file_id):
         else:
             mimetype = 'image/jpeg'  # Default fallback
         
-        # Create response with file content
-        response = make_response(file_content)
-        response.headers['Content-Type'] = mimetype
+        response = send_upload(file_record.file_path, mimetype)
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
         response.headers['Access-Control-Allow-Origin'] = '*'
-        response.headers['Content-Length'] = len(file_content)
         response.headers['Cross-Origin-Resource-Policy'] = 'cross-origin'
         
         return response
@@ -1161,47 +1200,21 @@ def public_image(file_id):
 @app.route('/logo')
 def serve_logo():
     """Dedicated route for serving the ReVibe logo"""
-    try:
-        logo_path = os.path.join(app.static_folder, 'images', 'revibe-logo.png')
-        if os.path.exists(logo_path):
-            return send_file(logo_path, mimetype='image/png')
-        else:
-            # Fallback to alternative logo
-            alt_logo_path = os.path.join(app.static_folder, 'images', 'ReVibe Logo.png')
-            if os.path.exists(alt_logo_path):
-                return send_file(alt_logo_path, mimetype='image/png')
-            else:
-                abort(404)
-    except Exception as e:
-        app.logger.error(f"Error serving logo: {str(e)}")
+    if LOGO_PATH is None:
         abort(404)
+    return send_file(LOGO_PATH, mimetype='image/png', max_age=STATIC_MAX_AGE, conditional=True)
 
 @app.route('/uploads/<path:filename>')
 def serve_upload_file(filename):
     """Serve files from the uploads directory"""
-    try:
-        # Security check - prevent path traversal
-        if '..' in filename or filename.startswith('/'):
-            abort(404)
-        
-        upload_folder = app.config.get('UPLOAD_FOLDER', 'uploads')
-        file_path = os.path.join(upload_folder, filename)
-        
-        # Check if file exists
-        if not os.path.exists(file_path):
-            abort(404)
-        
-        # Check file extension
-        allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.pdf', '.mp4', '.avi', '.mov'}
-        file_ext = os.path.splitext(filename)[1].lower()
-        if file_ext not in allowed_extensions:
-            abort(404)
-        
-        return send_file(file_path)
-        
-    except Exception as e:
-        app.logger.error(f"Error serving upload file {filename}: {str(e)}")
+    # Check file extension
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext not in UPLOAD_SERVE_EXTENSIONS:
         abort(404)
+    
+    # send_from_directory rejects path traversal and missing files with a 404
+    upload_folder = app.config.get('UPLOAD_FOLDER', 'uploads')
+    return send_from_directory(upload_folder, filename, max_age=STATIC_MAX_AGE)
 
 @app.route('/public_image/<filename>')
 def serve_image_by_filename(filename):
@@ -1218,19 +1231,14 @@ def serve_public_image(filename):
     """Direct image serving for external access compatibility"""
     try:
         # Security check - only allow specific file extensions
-        allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif'}
         file_ext = os.path.splitext(filename)[1].lower()
-        if file_ext not in allowed_extensions:
+        if file_ext not in PUBLIC_IMAGE_EXTENSIONS:
             abort(404)
         
         file_path = os.path.join('uploads', filename)
         if not os.path.exists(file_path):
             abort(404)
         
-        # Read and serve file directly with maximum compatibility headers
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
-        
         # Determine MIME type
         mime_type = 'image/jpeg'
         if file_ext == '.png':
@@ -1238,12 +1246,10 @@ def serve_public_image(filename):
         elif file_ext == '.gif':
             mime_type = 'image/gif'
         
-        app.logger.info(f"Successfully serving {filename} as {mime_type}, size: {len(file_data)} bytes")
+        app.logger.info(f"Successfully serving {filename} as {mime_type}")
         
         # Create response with headers optimized for external device access
-        response = make_response(file_data)
-        response.headers['Content-Type'] = mime_type
-        response.headers['Content-Length'] = len(file_data)
+        response = send_upload(file_path, mime_type)
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
@@ -1310,8 +1316,6 @@ def edit_sale(sale_id):
         sale.notes = request.form.get('notes', '')
         sale.zelle_payment = bool(request.form.get('zelle_payment'))
         
-        db.session.commit()
-        
         # Log the action
         log_action('update', 'sale', sale.id, request.remote_addr,
                    old_values=old_values,
@@ -1322,6 +1326,7 @@ def edit_sale(sale_id):
                        'notes': sale.notes,
                        'zelle_payment': sale.zelle_payment
                    })
+        db.session.commit()
         
         flash(f'Sale {sale.invoice_number} updated successfully', 'success')
         
@@ -1381,8 +1386,6 @@ def void_sale(sale_id):
                 inventory_item.quantity += sale_item.quantity_sold
                 inventory_item.status = 'available'
         
-        db.session.commit()
-        
         # Log the action
         log_action('void', 'sale', sale.id, request.remote_addr,
                    old_values=old_values,
@@ -1392,6 +1395,7 @@ def void_sale(sale_id):
                        'voided_by': sale.voided_by,
                        'void_reason': sale.void_reason
                    })
+        db.session.commit()
         
         flash(f'Sale {sale.invoice_number} has been voided. Items returned to inventory.', 'success')
         
@@ -1419,6 +1423,86 @@ def create_multi_item_sale():
         return redirect(url_for('sales'))
     
     try:
+        # Process sale items using new naming format: sale_items-INDEX-FIELD
+        sale_items_data = {}
+        # Handle both old and new form formats
+        for key, value in request.form.items():
+            match = SALE_ITEM_KEY_RE.fullmatch(key) or LEGACY_SALE_ITEM_KEY_RE.fullmatch(key)
+            if match:
+                item_index, field_name = match.group(1), match.group(2)
+                sale_items_data.setdefault(item_index, {})[field_name] = value
+        
+        # Load every referenced inventory row in one query, locked until the sale commits
+        inventory_ids = {int(item_data['inventory_id']) for item_data in sale_items_data.values()
+                         if item_data.get('inventory_id', '').isdigit()}
+        items_by_id = {}
+        if inventory_ids:
+            items_by_id = {item.id: item for item in InventoryItem.query.filter(
+                InventoryItem.id.in_(inventory_ids)).with_for_update().all()}
+        
+        # Pass 1: validate every line and build its row and stock decrement before any writes
+        sale_item_rows = []
+        decrements = {}
+        total_sale_price = total_discount_amount = final_total_price = DECIMAL_ZERO
+        for item_index, item_data in sale_items_data.items():
+            app.logger.debug("Processing item %s: %s", item_index, item_data)
+            if not all(key in item_data for key in ['inventory_id', 'quantity', 'unit_price']):
+                app.logger.debug("Skipping item %s - missing required fields. Has: %s", item_index, list(item_data))
+                continue
+                
+            # Skip empty inventory_id values
+            if not item_data['inventory_id'] or item_data['inventory_id'] == '':
+                app.logger.debug("Skipping item %s - empty inventory_id", item_index)
+                continue
+            
+            # Skip empty or invalid unit_price values
+            if not item_data['unit_price'] or item_data['unit_price'] == '':
+                app.logger.debug("Skipping item %s - empty unit_price", item_index)
+                continue
+                
+            try:
+                inventory_id = int(item_data['inventory_id'])
+                quantity = int(item_data['quantity'])
+                unit_price = Decimal(item_data['unit_price'])  # Form values are already strings
+                discount_raw = item_data.get('discount_percentage')
+                discount_percentage = Decimal(discount_raw) if discount_raw else DECIMAL_ZERO
+            except (ValueError, InvalidOperation) as e:
+                app.logger.debug("Skipping item %s - invalid data format: %s", item_index, e)
+                continue
+            
+            # Line totals are computed here since the bulk insert bypasses the ORM instance
+            line_total, discount_amount, final_line_total = SaleItem.compute_line_totals(
+                quantity, unit_price, discount_percentage)
+            sale_item_rows.append({
+                'inventory_id': inventory_id,
+                'quantity_sold': quantity,
+                'unit_price': unit_price,
+                'line_total': line_total,
+                'discount_percentage': discount_percentage,
+                'discount_amount': discount_amount,
+                'final_line_total': final_line_total
+            })
+            total_sale_price += line_total
+            total_discount_amount += discount_amount
+            final_total_price += final_line_total
+            
+            # Reserve inventory quantity (don't mark as sold for multi-item sales)
+            inventory_item = items_by_id.get(inventory_id)
+            if inventory_item:
+                reserved = decrements.get(inventory_id, 0)
+                if inventory_item.quantity - reserved >= quantity:
+                    decrements[inventory_id] = reserved + quantity
+                else:
+                    flash(f'Warning: Not enough quantity for {inventory_item.item_type}', 'warning')
+        
+        app.logger.debug("Validated %s sale items", len(sale_item_rows))
+        
+        if not sale_item_rows:
+            flash('Error: No valid sale items were processed. Please ensure items are selected properly.', 'danger')
+            db.session.rollback()
+            return redirect(url_for('sales'))
+        
+        # Pass 2: create the customer, sale, sale items and stock changes
         # Handle customer creation or selection
         customer_id = request.form.get('customer_id')
         if customer_id == '0':
@@ -1456,96 +1540,30 @@ def create_multi_item_sale():
         sale.discount_percentage = None
         sale.final_price = None
         
-        # Initialize totals
-        sale.total_sale_price = Decimal('0.00')
-        sale.total_discount_amount = Decimal('0.00')
-        sale.final_total_price = Decimal('0.00')
+        # Totals are already known from the validated lines, so they go out with the INSERT
+        sale.total_sale_price = total_sale_price
+        sale.total_discount_amount = total_discount_amount
+        sale.final_total_price = final_total_price
         
         db.session.add(sale)
         db.session.flush()  # Get the sale ID
         
-        # Process sale items using new naming format: sale_items-INDEX-FIELD
-        sale_items_data = {}
-        # Handle both old and new form formats
-        for key, value in request.form.items():
-            if key.startswith('sale_items[') and '][' in key:
-                # Parse sale_items[1][inventory_id] format (old format)
-                parts = key.replace('sale_items[', '').replace(']', '').split('][')
-                if len(parts) == 2:
-                    item_index, field_name = parts
-                    if item_index not in sale_items_data:
-                        sale_items_data[item_index] = {}
-                    sale_items_data[item_index][field_name] = value
-            elif key.startswith('sale_items-') and key.count('-') >= 2:
-                # Parse sale_items-1-inventory_id format (new format)
-                parts = key.split('-')
-                if len(parts) >= 3:
-                    item_index = parts[1]
-                    field_name = '-'.join(parts[2:])  # Handle field names with dashes
-                    if item_index not in sale_items_data:
-                        sale_items_data[item_index] = {}
-                    sale_items_data[item_index][field_name] = value
-        
-        # Create sale items
-        items_created = 0
-        for item_index, item_data in sale_items_data.items():
-            print(f"DEBUG: Processing item {item_index}: {item_data}")
-            if not all(key in item_data for key in ['inventory_id', 'quantity', 'unit_price']):
-                print(f"DEBUG: Skipping item {item_index} - missing required fields. Has: {list(item_data.keys())}")
-                continue
-                
-            # Skip empty inventory_id values
-            if not item_data['inventory_id'] or item_data['inventory_id'] == '':
-                print(f"DEBUG: Skipping item {item_index} - empty inventory_id")
-                continue
-            
-            # Skip empty or invalid unit_price values
-            if not item_data['unit_price'] or item_data['unit_price'] == '':
-                print(f"DEBUG: Skipping item {item_index} - empty unit_price")
-                continue
-                
-            try:
-                inventory_id = int(item_data['inventory_id'])
-                quantity = int(item_data['quantity'])
-                unit_price = Decimal(str(item_data['unit_price']))
-                discount_percentage = Decimal(str(item_data.get('discount_percentage', '0')))
-            except (ValueError, decimal.ConversionSyntax) as e:
-                print(f"DEBUG: Skipping item {item_index} - invalid data format: {e}")
-                continue
-            
-            # Create sale item
-            sale_item = SaleItem()
-            sale_item.sale_id = sale.id
-            sale_item.inventory_id = inventory_id
-            sale_item.quantity_sold = quantity
-            sale_item.unit_price = unit_price
-            sale_item.discount_percentage = discount_percentage
-            sale_item.calculate_line_totals()
-            
-            db.session.add(sale_item)
-            items_created += 1
-            print(f"DEBUG: Created sale item for inventory ID {inventory_id}")
-            
-            # Update inventory quantity (don't mark as sold for multi-item sales)
-            inventory_item = InventoryItem.query.get(inventory_id)
-            if inventory_item:
-                if inventory_item.quantity >= quantity:
-                    inventory_item.quantity -= quantity
-                    if inventory_item.quantity == 0:
-                        inventory_item.status = 'sold'
-                else:
-                    flash(f'Warning: Not enough quantity for {inventory_item.item_type}', 'warning')
-        
-        print(f"DEBUG: Created {items_created} sale items")
+        for row in sale_item_rows:
+            row['sale_id'] = sale.id
         
-        if items_created == 0:
-            flash('Error: No valid sale items were processed. Please ensure items are selected properly.', 'danger')
-            db.session.rollback()
-            return redirect(url_for('sales'))
+        db.session.execute(insert(SaleItem), sale_item_rows)
         
-        # Calculate sale totals
-        sale.calculate_totals()
-        db.session.commit()
+        # Decrement every affected inventory row in a single UPDATE ... CASE
+        if decrements:
+            decrement = case(decrements, value=InventoryItem.id, else_=0)
+            db.session.execute(
+                update(InventoryItem)
+                .where(InventoryItem.id.in_(decrements))
+                .values(
+                    quantity=InventoryItem.quantity - decrement,
+                    status=case((InventoryItem.quantity == decrement, 'sold'), else_=InventoryItem.status)
+                )
+            )
         
         # Log the action
         log_action('create', 'sale', sale.id, request.remote_addr,
@@ -1555,6 +1573,7 @@ def create_multi_item_sale():
                        'total_price': float(sale.final_total_price),
                        'payment_method': sale.payment_method
                    })
+        db.session.commit()
         
         flash(f'Multi-item sale {sale.invoice_number} created successfully!', 'success')
         
@@ -1573,12 +1592,12 @@ def share_receipt(sale_id):
     # Mark receipt as shared
     sale.receipt_shared = True
     sale.receipt_shared_at = datetime.utcnow()
+    log_action('share_receipt', 'sale', sale.id, request.remote_addr)
     db.session.commit()
     
     # Receipt shared successfully - no email needed, just hyperlink access
     flash('Receipt shared successfully! Customer can access it via the provided link.', 'success')
     
-    log_action('share_receipt', 'sale', sale.id, request.remote_addr)
     return redirect(url_for('sales'))
 
 @app.route('/sales/<int:sale_id>/download')
@@ -1586,53 +1605,43 @@ def share_receipt(sale_id):
 @login_required
 def download_receipt(sale_id, format_type='standard'):
     """Download PDF receipt - supports 'standard' or 'thermal' format"""
+    format_type = 'thermal' if format_type == 'thermal' else 'standard'
     try:
-        print(f"Receipt download requested - Sale ID: {sale_id}, Format: {format_type}")
-        
         sale = Sale.query.get_or_404(sale_id)
         customer = Customer.query.get(sale.customer_id)
         
-        print(f"Sale found: {sale.invoice_number}, Customer: {customer.name}")
-        
-        # For multi-item sales, pass None for single inventory item
-        if sale.inventory_id:
-            # Legacy single-item sale
-            inventory_item = InventoryItem.query.get(sale.inventory_id)
-            quantity_sold = sale.quantity_sold
-            print("Single-item sale detected")
-        else:
-            # Multi-item sale
-            inventory_item = None
-            quantity_sold = None
-            print(f"Multi-item sale detected with {len(sale.sale_items)} items")
-        
-        # Generate receipt PDF with specified format
-        receipt_path = create_sale_receipt(sale, customer, inventory_item, quantity_sold, format_type)
-        print(f"Receipt generated at: {receipt_path}")
-        
-        # Verify file exists
-        import os
+        # Reuse the cached PDF unless something printed on the receipt has changed
+        receipt_path = receipt_cache_path(sale, customer, format_type, app.config['RECEIPT_CACHE_DIR'])
         if not os.path.exists(receipt_path):
-            print(f"ERROR: Receipt file not found at {receipt_path}")
-            flash(f'Receipt file could not be generated', 'error')
-            return redirect(url_for('sales'))
-        
-        print(f"File exists, size: {os.path.getsize(receipt_path)} bytes")
+            # For multi-item sales, pass None for single inventory item
+            if sale.inventory_id:
+                # Legacy single-item sale
+                inventory_item = InventoryItem.query.get(sale.inventory_id)
+                quantity_sold = sale.quantity_sold
+            else:
+                # Multi-item sale
+                inventory_item = None
+                quantity_sold = None
+            
+            # Generate to a temporary file so concurrent downloads never see a partial PDF
+            temp_path = f"{receipt_path}.{uuid.uuid4().hex}.tmp"
+            create_sale_receipt(sale, customer, inventory_item, quantity_sold, format_type, filepath=temp_path)
+            os.replace(temp_path, receipt_path)
+            
+            # Earlier versions of this receipt were rendered from data that has since been edited
+            for stale_path in cached_receipt_paths(sale.id, app.config['RECEIPT_CACHE_DIR'], format_type):
+                if stale_path != receipt_path:
+                    unlink_quiet(stale_path)
+            app.logger.debug("Receipt for sale %s (%s) generated at %s", sale_id, format_type, receipt_path)
         
         format_suffix = "_thermal" if format_type == 'thermal' else ""
         filename = f'Receipt_{sale.invoice_number}{format_suffix}.pdf'
         
-        print(f"Sending file with name: {filename}")
-        response = send_file(receipt_path, as_attachment=True, download_name=filename, mimetype='application/pdf')
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        return response
+        # send_file adds Last-Modified/ETag from the cached file so browsers can revalidate
+        return send_file(receipt_path, as_attachment=True, download_name=filename, mimetype='application/pdf')
         
     except Exception as e:
-        print(f"ERROR in download_receipt: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error generating receipt for sale %s", sale_id)
         flash(f'Error generating receipt: {str(e)}', 'error')
         return redirect(url_for('sales'))
 
@@ -1689,14 +1698,20 @@ def share_receipt_sms(sale_id):
 @app.route('/receipt/<int:sale_id>')
 def public_receipt(sale_id):
     """Public receipt view - no login required"""
-    sale = Sale.query.get_or_404(sale_id)
-    customer = Customer.query.get(sale.customer_id)
-    inventory_item = InventoryItem.query.get(sale.inventory_id)
-    
-    return render_template('public_receipt.html', 
-                         sale=sale, 
-                         customer=customer, 
-                         inventory_item=inventory_item)
+    sale = Sale.query.options(
+        joinedload(Sale.customer),
+        joinedload(Sale.inventory_item),
+        selectinload(Sale.sale_items).joinedload(SaleItem.inventory_item)
+    ).get_or_404(sale_id)
+    
+    response = make_response(render_template('public_receipt.html', 
+                                             sale=sale, 
+                                             customer=sale.customer, 
+                                             inventory_item=sale.inventory_item))
+    # Receipt links are opened repeatedly from SMS/email, so let the client reuse them briefly;
+    # private keeps shared proxies from storing the customer's contact details
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response
 
 @app.route('/generate_product_flyer/<int:item_id>')
 @login_required
@@ -1756,18 +1771,19 @@ def public_view_item(item_id):
 @login_required
 def mobile_dashboard():
     """Mobile dashboard for field operations"""
-    from datetime import datetime, timedelta
-    
-    today = datetime.utcnow().date()
+    today_start = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    tomorrow_start = today_start + timedelta(days=1)
     
-    # Get today's stats
-    todays_items = InventoryItem.query.filter(
-        db.func.date(InventoryItem.created_at) == today,
+    # Get today's stats as plain column aggregates over a timestamp range
+    todays_items = db.session.query(db.func.count(InventoryItem.id)).filter(
+        InventoryItem.created_at >= today_start,
+        InventoryItem.created_at < tomorrow_start,
         InventoryItem.created_by == current_user.id
-    ).count()
+    ).scalar()
     
     todays_sales = db.session.query(db.func.sum(Sale.final_price)).filter(
-        db.func.date(Sale.sale_date) == today,
+        Sale.sale_date >= today_start,
+        Sale.sale_date < tomorrow_start,
         Sale.sold_by == current_user.id
     ).scalar() or 0
     
@@ -1825,19 +1841,19 @@ def mobile_complete_sale():
         if quantity_to_sell > inventory_item.quantity:
             return jsonify({'success': False, 'error': 'Not enough quantity available'})
         
-        # Calculate prices
-        discount_percentage = float(data.get('discount_percentage', 0))
-        sale_price = float(inventory_item.selling_price)
-        final_price = sale_price * quantity_to_sell * (1 - discount_percentage / 100)
+        # Calculate prices (JSON numbers arrive as int/float, so go through str for an exact Decimal)
+        discount_percentage = Decimal(str(data.get('discount_percentage') or 0))
+        sale_price = inventory_item.selling_price
+        final_price = (sale_price * quantity_to_sell * (100 - discount_percentage) / 100).quantize(Decimal('0.01'))
         
         # Create sale
         sale = Sale()
         sale.customer_id = customer.id
         sale.inventory_id = inventory_item.id
         sale.quantity_sold = quantity_to_sell
-        sale.sale_price = Decimal(str(sale_price))
-        sale.discount_percentage = Decimal(str(discount_percentage))
-        sale.final_price = Decimal(str(final_price))
+        sale.sale_price = sale_price
+        sale.discount_percentage = discount_percentage
+        sale.final_price = final_price
         sale.payment_method = data.get('payment_method', 'cash')
         sale.payment_receiver = data.get('payment_receiver', current_user.username)
         sale.notes = data.get('notes', '')
@@ -1855,7 +1871,7 @@ def mobile_complete_sale():
         db.session.commit()
         
         # Log the action
-        log_action('mobile_sale', 'sale', sale.id, request.remote_addr)
+        log_action('mobile_sale', 'sale', sale.id, request.remote_addr, autocommit=True)
         
         return jsonify({
             'success': True, 
@@ -1868,6 +1884,261 @@ def mobile_complete_sale():
         app.logger.error(f"Mobile sale error: {str(e)}")
         return jsonify({'success': False, 'error': 'Sale processing failed'})
 
+def report_aggregates(sales_query, inventory_query, users, start_date, end_date):
+    """Compute the /reports summary figures and per-user performance rows"""
+    # Calculate summary statistics in the database
+    total_sales, total_transactions = sales_query.with_entities(
+        func.coalesce(func.sum(SALE_AMOUNT), 0), func.count(Sale.id)
+    ).one()
+    total_sales = float(total_sales)
+    items_added, inventory_value = inventory_query.with_entities(
+        func.count(InventoryItem.id),
+        func.coalesce(func.sum(InventoryItem.selling_price * InventoryItem.quantity), 0)
+    ).one()
+    inventory_value = float(inventory_value)
+    
+    # Calculate gross profit; like the original loop, items without a purchase cost are left out
+    gross_profit = float(sales_query.join(InventoryItem, Sale.inventory_id == InventoryItem.id)
+                         .filter(InventoryItem.purchase_cost != 0).with_entities(
+        func.coalesce(func.sum(Sale.final_price - InventoryItem.purchase_cost * Sale.quantity_sold), 0)
+    ).scalar())
+    
+    profit_margin = (gross_profit / total_sales * 100) if total_sales > 0 else 0.0
+    
+    # Pending payments
+    pending_payments, pending_count = db.session.query(
+        func.coalesce(func.sum(SALE_AMOUNT), 0), func.count(Sale.id)
+    ).filter(Sale.payment_status == 'pending').one()
+    pending_payments = float(pending_payments)
+    
+    summary = {
+        'total_sales': total_sales,
+        'total_transactions': total_transactions,
+        'items_added': items_added,
+        'inventory_value': inventory_value,
+        'gross_profit': gross_profit,
+        'profit_margin': profit_margin,
+        'pending_payments': pending_payments,
+        'pending_count': pending_count
+    }
+    
+    # User performance data, aggregated per user in the database
+    user_performance = []
+    
+    sales_by_user = {
+        sold_by: (count, revenue, last_sale)
+        for sold_by, count, revenue, last_sale in sales_query.with_entities(
+            Sale.sold_by, func.count(Sale.id), func.sum(SALE_AMOUNT), func.max(Sale.sale_date)
+        ).group_by(Sale.sold_by)
+    }
+    items_by_user = {
+        created_by: (count, last_item)
+        for created_by, count, last_item in inventory_query.with_entities(
+            InventoryItem.created_by, func.count(InventoryItem.id), func.max(InventoryItem.created_at)
+        ).group_by(InventoryItem.created_by)
+    }
+    confirmations_by_user = dict(db.session.query(Sale.payment_confirmed_by, func.count(Sale.id)).filter(
+        Sale.payment_confirmed_at >= start_date,
+        Sale.payment_confirmed_at < end_date
+    ).group_by(Sale.payment_confirmed_by).all())
+    
+    for user in users:
+        sales_count, sales_revenue, last_sale = sales_by_user.get(user.id, (0, None, None))
+        user_items_added, last_item = items_by_user.get(user.id, (0, None))
+        
+        # Last activity from sales/inventory
+        last_activity = last_sale
+        if last_item and (not last_activity or last_item > last_activity):
+            last_activity = last_item
+        
+        user_performance.append({
+            'username': user.username,
+            'role': user.role,
+            'items_added': user_items_added,
+            'sales_count': sales_count,
+            'sales_revenue': float(sales_revenue or 0),
+            'payments_confirmed': confirmations_by_user.get(user.id, 0),
+            'last_activity': last_activity
+        })
+    
+    return summary, user_performance
+
+# Shared by every PDF report table; the commands use whole-table ranges, so they fit any row count
+REPORT_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 9),
+    ('FONTSIZE', (0, 1), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+@lru_cache(maxsize=4096)
+def report_date(day):
+    """MM/DD/YYYY label for a report row; a report spans few distinct days, so each is formatted once"""
+    return day.strftime('%m/%d/%Y')
+
+@lru_cache(maxsize=None)
+def report_pdf_styles():
+    """Title, summary and footer paragraph styles for PDF report exports, built once"""
+    styles = getSampleStyleSheet()
+    
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        textColor=colors.darkblue
+    )
+    
+    summary_style = ParagraphStyle(
+        'Summary',
+        parent=styles['Normal'],
+        fontSize=10,
+        spaceAfter=12
+    )
+    
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=styles['Normal'],
+        fontSize=8,
+        textColor=colors.grey
+    )
+    return title_style, summary_style, footer_style
+
+# SQL form of sale_amount(), for totals that must agree with the rows they summarise
+SALE_AMOUNT = func.coalesce(Sale.final_price, Sale.final_total_price)
+
+def sale_amount(sale):
+    """Amount to show for a sale row; multi-item sales only carry final_total_price"""
+    return sale.final_price if sale.final_price is not None else (sale.final_total_price or DECIMAL_ZERO)
+
+def sale_item_label(sale):
+    """Item column for a sale row; multi-item sales have no single inventory item"""
+    return sale.inventory_item.item_type if sale.inventory_item else 'Multiple items'
+
+def report_sum(summary_query, expression):
+    """SUM of expression over a report's filtered rows, computed by the database"""
+    return float(summary_query.with_entities(func.coalesce(func.sum(expression), 0)).scalar())
+
+# PDF report builders add their title and summary to the story and return
+# (table rows, column widths, filename); summary_query is the report's filtered query without loader options
+def build_sales_report(story, records, summary_query, start_date_str, end_date_str):
+    """Sales report: sales made in the date range"""
+    title_style, summary_style, _ = report_pdf_styles()
+    
+    story.append(Paragraph(f"Sales Report ({start_date_str} to {end_date_str})", title_style))
+    story.append(Spacer(1, 12))
+    
+    total_amount = report_sum(summary_query, SALE_AMOUNT)
+    story.append(Paragraph(f"Total Sales: ${total_amount:.2f} | Transactions: {len(records)}", summary_style))
+    story.append(Spacer(1, 12))
+    
+    table_data = [['Date', 'Invoice', 'Customer', 'Item', 'Amount', 'Payment', 'Status', 'Sold By']]
+    table_data.extend([
+        [
+            report_date(sale.sale_date.date()),
+            sale.invoice_number,
+            sale.customer.name[:20],
+            sale_item_label(sale)[:25],
+            f"${sale_amount(sale):.2f}",
+            sale.payment_method,
+            sale.payment_status,
+            sale.sold_by_user.username
+        ]
+        for sale in records
+    ])
+    col_widths = [0.9*inch, 1.3*inch, 1.6*inch, 1.7*inch, 0.9*inch, 1.1*inch, 1.0*inch, 1.3*inch]
+    return table_data, col_widths, f"sales_report_{start_date_str}_to_{end_date_str}.pdf"
+
+def build_inventory_report(story, records, summary_query, start_date_str, end_date_str):
+    """Inventory report: items added in the date range"""
+    title_style, summary_style, _ = report_pdf_styles()
+    
+    story.append(Paragraph(f"Inventory Report ({start_date_str} to {end_date_str})", title_style))
+    story.append(Spacer(1, 12))
+    
+    total_value = report_sum(summary_query, InventoryItem.selling_price * InventoryItem.quantity)
+    story.append(Paragraph(f"Total Inventory Value: ${total_value:.2f} | Items: {len(records)}", summary_style))
+    story.append(Spacer(1, 12))
+    
+    table_data = [['Date', 'Item Type', 'Source', 'Qty', 'Cost', 'Price', 'Discount', 'Status']]
+    table_data.extend([
+        [
+            report_date(item.created_at.date()),
+            item.item_type[:25],
+            item.source_location[:20],
+            str(item.quantity),
+            f"${item.purchase_cost:.2f}",
+            f"${item.selling_price:.2f}",
+            f"{item.discount_percentage}%" if item.discount_percentage > 0 else "-",
+            item.status
+        ]
+        for item in records
+    ])
+    col_widths = [0.9*inch, 2.0*inch, 1.7*inch, 0.6*inch, 0.9*inch, 0.9*inch, 0.9*inch, 1.0*inch]
+    return table_data, col_widths, f"inventory_report_{start_date_str}_to_{end_date_str}.pdf"
+
+def build_reconciliation_report(story, records, summary_query, start_date_str, end_date_str):
+    """Reconciliation report: payments confirmed in the date range, as column tuples"""
+    title_style, summary_style, _ = report_pdf_styles()
+    
+    story.append(Paragraph(f"Reconciliation Report ({start_date_str} to {end_date_str})", title_style))
+    story.append(Spacer(1, 12))
+    
+    total_confirmed = report_sum(summary_query, SALE_AMOUNT)
+    story.append(Paragraph(f"Total Confirmed: ${total_confirmed:.2f} | Payments: {len(records)}", summary_style))
+    story.append(Spacer(1, 12))
+    
+    table_data = [['Invoice', 'Sale Date', 'Customer', 'Amount', 'Payment Method', 'Confirmed By']]
+    table_data.extend([
+        [
+            row.invoice_number,
+            report_date(row.sale_date.date()),
+            row.customer_name[:20],
+            f"${sale_amount(row):.2f}",
+            row.payment_method,
+            row.confirmed_by or ''
+        ]
+        for row in records
+    ])
+    col_widths = [1.4*inch, 1.0*inch, 1.8*inch, 1.0*inch, 1.4*inch, 1.4*inch]
+    return table_data, col_widths, f"reconciliation_report_{start_date_str}_to_{end_date_str}.pdf"
+
+def build_user_report(story, records, summary_query, start_date_str, end_date_str):
+    """User report: active user accounts"""
+    title_style, summary_style, _ = report_pdf_styles()
+    
+    story.append(Paragraph(f"User Performance Report ({start_date_str} to {end_date_str})", title_style))
+    story.append(Spacer(1, 12))
+    
+    story.append(Paragraph(f"Active Users: {len(records)}", summary_style))
+    story.append(Spacer(1, 12))
+    
+    table_data = [['Username', 'Role', 'Email', 'Created', 'Status']]
+    table_data.extend([
+        [
+            user.username,
+            user.role.replace('_', ' ').title(),
+            user.email[:30],
+            report_date(user.created_at.date()),
+            'Active' if user.is_active else 'Inactive'
+        ]
+        for user in records
+    ])
+    col_widths = [1.8*inch, 1.6*inch, 2.8*inch, 1.0*inch, 0.9*inch]
+    return table_data, col_widths, f"user_report_{start_date_str}_to_{end_date_str}.pdf"
+
+REPORT_BUILDERS = {
+    'sales': build_sales_report,
+    'inventory': build_inventory_report,
+    'reconciliation': build_reconciliation_report,
+    'users': build_user_report,
+}
+
 # Business Reports Routes
 @app.route('/reports')
 @login_required
@@ -1877,10 +2148,6 @@ def reports():
         flash('You do not have permission to view reports', 'danger')
         return redirect(url_for('dashboard'))
     
-    from datetime import datetime, timedelta
-    import csv
-    import io
-    
     # Get date filters from request
     end_date_str = request.args.get('end_date', datetime.utcnow().strftime('%Y-%m-%d'))
     start_date_str = request.args.get('start_date', (datetime.utcnow() - timedelta(days=30)).strftime('%Y-%m-%d'))
@@ -1907,80 +2174,25 @@ def reports():
             pass
     
     # Sales data
-    sales_data = sales_query.order_by(Sale.sale_date.desc()).all()
+    sales_data = sales_query.options(*sale_report_options()).order_by(Sale.sale_date.desc()).all()
     
     # Inventory data
-    inventory_data = inventory_query.order_by(InventoryItem.created_at.desc()).all()
+    inventory_data = inventory_query.options(selectinload(InventoryItem.created_by_user))\
+        .order_by(InventoryItem.created_at.desc()).all()
     
     # Reconciliation data (confirmed payments)
-    reconciliation_data = Sale.query.filter(
+    reconciliation_data = Sale.query.options(*sale_report_options()).filter(
         Sale.payment_confirmed_at.isnot(None),
         Sale.payment_confirmed_at >= start_date,
         Sale.payment_confirmed_at < end_date
     ).order_by(Sale.payment_confirmed_at.desc()).all()
     
-    # Calculate summary statistics
-    total_sales = float(sum(sale.final_price for sale in sales_data)) if sales_data else 0.0
-    total_transactions = len(sales_data)
-    items_added = len(inventory_data)
-    inventory_value = float(sum(item.selling_price * item.quantity for item in inventory_data)) if inventory_data else 0.0
-    
-    # Calculate gross profit
-    gross_profit = 0.0
-    for sale in sales_data:
-        if sale.inventory_item and sale.inventory_item.purchase_cost:
-            profit = float(sale.final_price) - (float(sale.inventory_item.purchase_cost) * sale.quantity_sold)
-            gross_profit += profit
-    
-    profit_margin = (gross_profit / total_sales * 100) if total_sales > 0 else 0.0
-    
-    # Pending payments
-    pending_sales = Sale.query.filter_by(payment_status='pending').all()
-    pending_payments = float(sum(sale.final_price for sale in pending_sales)) if pending_sales else 0.0
-    pending_count = len(pending_sales)
-    
-    summary = {
-        'total_sales': total_sales,
-        'total_transactions': total_transactions,
-        'items_added': items_added,
-        'inventory_value': inventory_value,
-        'gross_profit': gross_profit,
-        'profit_margin': profit_margin,
-        'pending_payments': pending_payments,
-        'pending_count': pending_count
-    }
-    
-    # User performance data
+    # Summary and per-user aggregates are cached briefly and dropped on any data change
     users = User.query.filter_by(is_active=True).all()
-    user_performance = []
-    
-    for user in users:
-        user_sales = [sale for sale in sales_data if sale.sold_by == user.id]
-        user_items = [item for item in inventory_data if item.created_by == user.id]
-        user_confirmations = Sale.query.filter(
-            Sale.payment_confirmed_by == user.id,
-            Sale.payment_confirmed_at >= start_date,
-            Sale.payment_confirmed_at < end_date
-        ).count()
-        
-        # Last activity from audit logs or sales/inventory
-        last_activity = None
-        if user_sales:
-            last_activity = max(sale.sale_date for sale in user_sales)
-        if user_items:
-            item_date = max(item.created_at for item in user_items)
-            if not last_activity or item_date > last_activity:
-                last_activity = item_date
-        
-        user_performance.append({
-            'username': user.username,
-            'role': user.role,
-            'items_added': len(user_items),
-            'sales_count': len(user_sales),
-            'sales_revenue': float(sum(sale.final_price for sale in user_sales)) if user_sales else 0.0,
-            'payments_confirmed': user_confirmations,
-            'last_activity': last_activity
-        })
+    summary, user_performance = cached_report_data(
+        ('reports', start_date_str, end_date_str, user_filter),
+        lambda: report_aggregates(sales_query, inventory_query, users, start_date, end_date)
+    )
     
     return render_template('reports.html',
                          current_date=datetime.utcnow(),
@@ -2006,10 +2218,6 @@ def export_reports():
     report_type = request.args.get('report_type', 'sales')  # sales, inventory, reconciliation, users
     
     # Get same data as reports view with filters
-    from datetime import datetime, timedelta
-    import csv
-    import io
-    
     end_date_str = request.args.get('end_date', datetime.utcnow().strftime('%Y-%m-%d'))
     start_date_str = request.args.get('start_date', (datetime.utcnow() - timedelta(days=30)).strftime('%Y-%m-%d'))
     user_filter = request.args.get('user_filter', '')
@@ -2034,51 +2242,54 @@ def export_reports():
         except ValueError:
             pass
     
-    # Get data based on report type
+    # Build the query for the requested report type; summary_query keeps the bare filters for aggregates
     if report_type == 'sales':
-        sales_data = sales_query.order_by(Sale.sale_date.desc()).all()
-        data_to_export = sales_data
+        summary_query = sales_query
+        export_query = summary_query.options(*sale_report_options()).order_by(Sale.sale_date.desc())
     elif report_type == 'inventory':
-        inventory_data = inventory_query.order_by(InventoryItem.created_at.desc()).all()
-        data_to_export = inventory_data
+        summary_query = inventory_query
+        export_query = summary_query.options(joinedload(InventoryItem.created_by_user))\
+            .order_by(InventoryItem.created_at.desc())
     elif report_type == 'reconciliation':
-        reconciliation_data = Sale.query.filter(
+        summary_query = Sale.query.filter(
             Sale.payment_confirmed_at.isnot(None),
             Sale.payment_confirmed_at >= start_date,
             Sale.payment_confirmed_at < end_date
-        ).order_by(Sale.payment_confirmed_at.desc()).all()
-        data_to_export = reconciliation_data
+        )
+        # Reconciliation rows only need a handful of columns, so read them as tuples rather than Sale objects
+        export_query = summary_query.join(Customer, Customer.id == Sale.customer_id)\
+            .outerjoin(User, User.id == Sale.payment_confirmed_by)\
+            .with_entities(
+                Sale.invoice_number, Sale.sale_date, Customer.name.label('customer_name'),
+                Sale.final_price, Sale.final_total_price,
+                Sale.payment_method, Sale.payment_confirmed_at, User.username.label('confirmed_by')
+            ).order_by(Sale.payment_confirmed_at.desc())
     else:  # users
-        users = User.query.filter_by(is_active=True).all()
-        data_to_export = users
+        summary_query = export_query = User.query.filter_by(is_active=True)
     
     if format_type == 'csv':
-        # Create CSV export
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers and data based on report type
+        # Headers and row layout based on report type
         if report_type == 'sales':
-            writer.writerow(['Date', 'Invoice', 'Customer', 'Item', 'Amount', 'Payment Method', 'Status', 'Sold By', 'Confirmed By', 'Confirmed Date'])
-            for sale in data_to_export:
-                writer.writerow([
+            header = ['Date', 'Invoice', 'Customer', 'Item', 'Amount', 'Payment Method', 'Status', 'Sold By', 'Confirmed By', 'Confirmed Date']
+            def csv_row(sale):
+                return [
                     sale.sale_date.strftime('%Y-%m-%d %H:%M'),
                     sale.invoice_number,
                     sale.customer.name,
-                    sale.inventory_item.item_type,
-                    f"{sale.final_price:.2f}",
+                    sale_item_label(sale),
+                    f"{sale_amount(sale):.2f}",
                     sale.payment_method,
                     sale.payment_status,
                     sale.sold_by_user.username,
                     sale.payment_confirmed_by_user.username if sale.payment_confirmed_by_user else '',
                     sale.payment_confirmed_at.strftime('%Y-%m-%d %H:%M') if sale.payment_confirmed_at else ''
-                ])
+                ]
             filename = f"sales_report_{start_date_str}_to_{end_date_str}.csv"
         
         elif report_type == 'inventory':
-            writer.writerow(['Date Added', 'Item Type', 'Source', 'Quantity', 'Purchase Cost', 'Selling Price', 'Discount', 'Status', 'Added By'])
-            for item in data_to_export:
-                writer.writerow([
+            header = ['Date Added', 'Item Type', 'Source', 'Quantity', 'Purchase Cost', 'Selling Price', 'Discount', 'Status', 'Added By']
+            def csv_row(item):
+                return [
                     item.created_at.strftime('%Y-%m-%d %H:%M'),
                     item.item_type,
                     item.source_location,
@@ -2088,56 +2299,58 @@ def export_reports():
                     f"{item.discount_percentage}%" if item.discount_percentage > 0 else "No discount",
                     item.status,
                     item.created_by_user.username
-                ])
+                ]
             filename = f"inventory_report_{start_date_str}_to_{end_date_str}.csv"
         
         elif report_type == 'reconciliation':
-            writer.writerow(['Invoice', 'Sale Date', 'Customer', 'Amount', 'Payment Method', 'Confirmed Date', 'Confirmed By'])
-            for sale in data_to_export:
-                writer.writerow([
-                    sale.invoice_number,
-                    sale.sale_date.strftime('%Y-%m-%d %H:%M'),
-                    sale.customer.name,
-                    f"{sale.final_price:.2f}",
-                    sale.payment_method,
-                    sale.payment_confirmed_at.strftime('%Y-%m-%d %H:%M') if sale.payment_confirmed_at else '',
-                    sale.payment_confirmed_by_user.username if sale.payment_confirmed_by_user else ''
-                ])
+            header = ['Invoice', 'Sale Date', 'Customer', 'Amount', 'Payment Method', 'Confirmed Date', 'Confirmed By']
+            def csv_row(row):
+                return [
+                    row.invoice_number,
+                    row.sale_date.strftime('%Y-%m-%d %H:%M'),
+                    row.customer_name,
+                    f"{sale_amount(row):.2f}",
+                    row.payment_method,
+                    row.payment_confirmed_at.strftime('%Y-%m-%d %H:%M') if row.payment_confirmed_at else '',
+                    row.confirmed_by or ''
+                ]
             filename = f"reconciliation_report_{start_date_str}_to_{end_date_str}.csv"
         
         else:  # users
-            writer.writerow(['Username', 'Role', 'Email', 'Created', 'Status'])
-            for user in data_to_export:
-                writer.writerow([
+            header = ['Username', 'Role', 'Email', 'Created', 'Status']
+            def csv_row(user):
+                return [
                     user.username,
                     user.role.replace('_', ' ').title(),
                     user.email,
                     user.created_at.strftime('%Y-%m-%d'),
                     'Active' if user.is_active else 'Inactive'
-                ])
+                ]
             filename = f"user_report_{start_date_str}_to_{end_date_str}.csv"
         
-        # Create response
-        output.seek(0)
-        return make_response(
-            output.getvalue(),
-            200,
-            {
-                'Content-Disposition': f'attachment; filename={filename}',
-                'Content-Type': 'text/csv'
-            }
+        def generate():
+            # Stream rows in chunks as the database yields them instead of building the whole file
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(header)
+            records = iter(export_query.yield_per(CSV_EXPORT_BATCH_SIZE))
+            while batch := list(islice(records, CSV_EXPORT_BATCH_SIZE)):
+                writer.writerows(map(csv_row, batch))
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+            yield output.getvalue()
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
         )
     
     else:  # PDF format
+        data_to_export = export_query.all()
+        
         # Create PDF export using ReportLab
-        from reportlab.lib.pagesizes import letter, landscape
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib import colors
-        from reportlab.lib.units import inch
-        import io
-        
-        # Create PDF buffer
         buffer = io.BytesIO()
         
         # Create PDF document
@@ -2147,146 +2360,28 @@ def export_reports():
         
         # Build story
         story = []
-        styles = getSampleStyleSheet()
-        
-        # Title and table data based on report type
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            spaceAfter=30,
-            textColor=colors.darkblue
-        )
         
-        summary_style = ParagraphStyle(
-            'Summary',
-            parent=styles['Normal'],
-            fontSize=10,
-            spaceAfter=12
-        )
+        # Title, summary and table rows for the report type
+        build_report = REPORT_BUILDERS.get(report_type, build_user_report)
+        table_data, col_widths, filename = build_report(story, data_to_export, summary_query, start_date_str, end_date_str)
         
-        if report_type == 'sales':
-            story.append(Paragraph(f"Sales Report ({start_date_str} to {end_date_str})", title_style))
-            story.append(Spacer(1, 12))
-            
-            total_amount = float(sum(sale.final_price for sale in data_to_export)) if data_to_export else 0.0
-            story.append(Paragraph(f"Total Sales: ${total_amount:.2f} | Transactions: {len(data_to_export)}", summary_style))
-            story.append(Spacer(1, 12))
-            
-            table_data = [['Date', 'Invoice', 'Customer', 'Item', 'Amount', 'Payment', 'Status', 'Sold By']]
-            for sale in data_to_export:
-                table_data.append([
-                    sale.sale_date.strftime('%m/%d/%Y'),
-                    sale.invoice_number,
-                    sale.customer.name[:20],
-                    sale.inventory_item.item_type[:25],
-                    f"${sale.final_price:.2f}",
-                    sale.payment_method,
-                    sale.payment_status,
-                    sale.sold_by_user.username
-                ])
-            filename = f"sales_report_{start_date_str}_to_{end_date_str}.pdf"
-        
-        elif report_type == 'inventory':
-            story.append(Paragraph(f"Inventory Report ({start_date_str} to {end_date_str})", title_style))
-            story.append(Spacer(1, 12))
-            
-            total_value = float(sum(item.selling_price * item.quantity for item in data_to_export)) if data_to_export else 0.0
-            story.append(Paragraph(f"Total Inventory Value: ${total_value:.2f} | Items: {len(data_to_export)}", summary_style))
-            story.append(Spacer(1, 12))
-            
-            table_data = [['Date', 'Item Type', 'Source', 'Qty', 'Cost', 'Price', 'Discount', 'Status']]
-            for item in data_to_export:
-                table_data.append([
-                    item.created_at.strftime('%m/%d/%Y'),
-                    item.item_type[:25],
-                    item.source_location[:20],
-                    str(item.quantity),
-                    f"${item.purchase_cost:.2f}",
-                    f"${item.selling_price:.2f}",
-                    f"{item.discount_percentage}%" if item.discount_percentage > 0 else "-",
-                    item.status
-                ])
-            filename = f"inventory_report_{start_date_str}_to_{end_date_str}.pdf"
-        
-        elif report_type == 'reconciliation':
-            story.append(Paragraph(f"Reconciliation Report ({start_date_str} to {end_date_str})", title_style))
-            story.append(Spacer(1, 12))
-            
-            total_confirmed = float(sum(sale.final_price for sale in data_to_export)) if data_to_export else 0.0
-            story.append(Paragraph(f"Total Confirmed: ${total_confirmed:.2f} | Payments: {len(data_to_export)}", summary_style))
-            story.append(Spacer(1, 12))
-            
-            table_data = [['Invoice', 'Sale Date', 'Customer', 'Amount', 'Payment Method', 'Confirmed By']]
-            for sale in data_to_export:
-                table_data.append([
-                    sale.invoice_number,
-                    sale.sale_date.strftime('%m/%d/%Y'),
-                    sale.customer.name[:20],
-                    f"${sale.final_price:.2f}",
-                    sale.payment_method,
-                    sale.payment_confirmed_by_user.username if sale.payment_confirmed_by_user else ''
-                ])
-            filename = f"reconciliation_report_{start_date_str}_to_{end_date_str}.pdf"
-        
-        else:  # users
-            story.append(Paragraph(f"User Performance Report ({start_date_str} to {end_date_str})", title_style))
-            story.append(Spacer(1, 12))
-            
-            story.append(Paragraph(f"Active Users: {len(data_to_export)}", summary_style))
-            story.append(Spacer(1, 12))
-            
-            table_data = [['Username', 'Role', 'Email', 'Created', 'Status']]
-            for user in data_to_export:
-                table_data.append([
-                    user.username,
-                    user.role.replace('_', ' ').title(),
-                    user.email[:30],
-                    user.created_at.strftime('%m/%d/%Y'),
-                    'Active' if user.is_active else 'Inactive'
-                ])
-            filename = f"user_report_{start_date_str}_to_{end_date_str}.pdf"
-        
-        # Create table
-        table = Table(table_data, repeatRows=1)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        # Fixed column widths let LongTable skip measuring every cell to size the columns
+        table = LongTable(table_data, colWidths=col_widths, repeatRows=1)
+        table.setStyle(REPORT_TABLE_STYLE)
         
         story.append(table)
         
         # Add footer
         story.append(Spacer(1, 20))
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=8,
-            textColor=colors.grey
-        )
+        _, _, footer_style = report_pdf_styles()
         story.append(Paragraph(f"Generated on {datetime.utcnow().strftime('%Y-%m-%d %H:%M')} | Recycling Business Manager", footer_style))
         
         # Build PDF
         doc.build(story)
         
-        # Create response
+        # Stream the response straight from the buffer instead of copying the PDF into a new bytes object
         buffer.seek(0)
-        
-        return make_response(
-            buffer.getvalue(),
-            200,
-            {
-                'Content-Disposition': f'attachment; filename={filename}',
-                'Content-Type': 'application/pdf'
-            }
-        )
+        return send_file(buffer, mimetype='application/pdf', as_attachment=True, download_name=filename)
 
 # Admin-only Delete Routes
 @app.route('/admin/delete_inventory/<int:item_id>', methods=['POST'])
@@ -2300,16 +2395,14 @@ def admin_delete_inventory(item_id):
     item = InventoryItem.query.get_or_404(item_id)
     
     # Check if item has been sold
-    if Sale.query.filter_by(inventory_id=item_id).first():
+    if db.session.query(Sale.query.filter_by(inventory_id=item_id).exists()).scalar():
         flash('Cannot delete inventory item that has been sold', 'danger')
         return redirect(url_for('inventory'))
     
     try:
-        # Delete associated files first
+        # Delete associated file records; the files on disk go after the commit
+        file_paths = [file.file_path for file in item.files]
         for file in item.files:
-            # Delete physical file if it exists
-            if os.path.exists(file.file_path):
-                os.remove(file.file_path)
             db.session.delete(file)
         
         # Log the deletion
@@ -2319,6 +2412,8 @@ def admin_delete_inventory(item_id):
         db.session.delete(item)
         db.session.commit()
         
+        batch_unlink(file_paths)
+        
         flash(f'Inventory item "{item.item_type}" has been permanently deleted', 'success')
     except Exception as e:
         db.session.rollback()
@@ -2352,19 +2447,19 @@ def admin_delete_sale(sale_id):
                     if sale_item.inventory_item.status == 'sold':
                         sale_item.inventory_item.status = 'available'
         
-        # Delete payment proof file if it exists
-        if sale.payment_proof_file:
-            proof_path = os.path.join('uploads', 'payment_proofs', sale.payment_proof_file)
-            if os.path.exists(proof_path):
-                os.remove(proof_path)
-        
         # Log the deletion
         log_action('delete_sale', 'sale', sale_id, request.remote_addr,
                    old_values={'invoice_number': sale.invoice_number, 'final_price': str(sale.final_price)})
         
+        proof_file = sale.payment_proof_file
         db.session.delete(sale)
         db.session.commit()
         
+        # Delete payment proof file and cached receipts once the sale is gone
+        if proof_file:
+            unlink_quiet(os.path.join('uploads', 'payment_proofs', proof_file))
+        batch_unlink(cached_receipt_paths(sale_id, app.config['RECEIPT_CACHE_DIR']))
+        
         flash(f'Sale transaction {sale.invoice_number} has been permanently deleted and inventory restored', 'success')
     except Exception as e:
         db.session.rollback()
@@ -2384,7 +2479,7 @@ def admin_delete_customer(customer_id):
     customer = Customer.query.get_or_404(customer_id)
     
     # Check if customer has any sales
-    if Sale.query.filter_by(customer_id=customer_id).first():
+    if db.session.query(Sale.query.filter_by(customer_id=customer_id).exists()).scalar():
         flash('Cannot delete customer with existing sales transactions', 'danger')
         return redirect(url_for('sales'))
     
@@ -2,6 +2,8 @@
 Template helper functions for safe calculations
 """
 from decimal import Decimal
+from sqlalchemy import func
+from models import InventoryItem
 
 
 def safe_calculate_totals(items):
@@ -21,13 +23,8 @@ def safe_calculate_totals(items):
         if item.selling_price:
             total_revenue += float(item.selling_price) * quantity
             
-        if item.selling_price and item.purchase_cost:
-            selling = float(item.selling_price)
-            purchase = float(item.purchase_cost)
-            gross = selling - purchase
-            overhead = selling * 0.3
-            net_per_item = gross - overhead
-            total_net_profit += net_per_item * quantity
+        # net_profit is 0 unless both prices are set
+        total_net_profit += item.net_profit * quantity
     
     return {
         'total_quantity': total_quantity,
@@ -37,13 +34,25 @@ def safe_calculate_totals(items):
     }
 
 
+def sql_totals(query):
+    """Calculate the same totals as safe_calculate_totals with one aggregate query"""
+    # Mirror the Python rules: missing or zero quantity counts as 1, profit needs both prices
+    quantity = func.coalesce(func.nullif(InventoryItem.quantity, 0), 1)
+    total_quantity, total_investment, total_revenue, total_net_profit = query.with_entities(
+        func.coalesce(func.sum(quantity), 0),
+        func.coalesce(func.sum(func.coalesce(InventoryItem.purchase_cost, 0) * quantity), 0),
+        func.coalesce(func.sum(func.coalesce(InventoryItem.selling_price, 0) * quantity), 0),
+        func.coalesce(func.sum(InventoryItem.net_profit * quantity), 0)
+    ).one()
+    
+    return {
+        'total_quantity': int(total_quantity),
+        'total_investment': float(total_investment),
+        'total_revenue': float(total_revenue),
+        'total_net_profit': float(total_net_profit)
+    }
+
+
 def safe_calculate_item_profit(item):
     """Calculate profit for individual item safely"""
-    if not (item.selling_price and item.purchase_cost):
-        return 0.0
-    
-    selling = float(item.selling_price)
-    purchase = float(item.purchase_cost)
-    gross = selling - purchase
-    overhead = selling * 0.3
-    return gross - overhead
\ No newline at end of file
+    return item.net_profit
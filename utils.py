@@ -1,63 +1,183 @@
+# Text built from a variable number of parts (email bodies, exports) is collected
+# in a list and joined once; never grow a string with += inside a loop.
 import os
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from flask_mail import Message
 from flask_login import current_user
 from app import db, mail
-from models import AuditLog
+from models import AuditLog, InventoryItem, Sale, SaleItem, User
 
-ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'mp4', 'avi', 'mov', 'wmv', 'mkv', 'webm', 'pdf'}
+ALLOWED_EXTENSIONS = frozenset({'jpg', 'jpeg', 'png', 'gif', 'mp4', 'avi', 'mov', 'wmv', 'mkv', 'webm', 'pdf'})
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    _, dot, extension = filename.rpartition('.')
+    return bool(dot) and extension.lower() in ALLOWED_EXTENSIONS
 
-def log_action(action, table_name, record_id, ip_address, old_values=None, new_values=None):
-    """Log user actions for audit trail"""
+def log_action(action, table_name, record_id, ip_address, old_values=None, new_values=None, autocommit=False):
+    """Log user actions for audit trail
+
+    The audit row is added to the caller's transaction and written by its commit.
+    Callers that have already committed pass autocommit=True.
+    """
     try:
         audit_log = AuditLog(
             user_id=current_user.id if current_user.is_authenticated else None,
             action=action,
             table_name=table_name,
             record_id=record_id,
-            old_values=json.dumps(old_values) if old_values else None,
-            new_values=json.dumps(new_values) if new_values else None,
+            # Values json can't encode natively (datetimes, Decimals) are stored as their str()
+            old_values=json.dumps(old_values, default=str) if old_values else None,
+            new_values=json.dumps(new_values, default=str) if new_values else None,
             ip_address=ip_address
         )
         db.session.add(audit_log)
-        db.session.commit()
+        if autocommit:
+            db.session.commit()
     except Exception as e:
         current_app.logger.error(f"Failed to log action: {str(e)}")
-        db.session.rollback()
+        if autocommit:
+            db.session.rollback()
+
+def unlink_quiet(path):
+    """Remove a file, treating an already missing file as removed"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        current_app.logger.warning("unlink failed for %s: %s", path, e)
+
+UNLINK_BATCH_THRESHOLD = 4
+UNLINK_MAX_WORKERS = 8
+
+def batch_unlink(paths):
+    """Remove many files, overlapping the unlink calls when there are more than a few"""
+    if len(paths) <= UNLINK_BATCH_THRESHOLD:
+        for path in paths:
+            unlink_quiet(path)
+        return
+    
+    # unlink releases the GIL, so a small pool overlaps the blocking syscalls;
+    # each worker needs the app context because unlink_quiet logs through current_app
+    app = current_app._get_current_object()
+    def unlink_in_app(path):
+        with app.app_context():
+            unlink_quiet(path)
+    with ThreadPoolExecutor(max_workers=min(UNLINK_MAX_WORKERS, len(paths))) as executor:
+        list(executor.map(unlink_in_app, paths))
+
+# SMTP round trips run off the request thread; a couple of workers keep up with receipt volume
+EMAIL_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='email')
+
+@lru_cache(maxsize=1)
+def mail_settings(app):
+    """(MAIL_USERNAME, office recipient) for app; mail config is fixed once the app has started"""
+    return (
+        app.config.get('MAIL_USERNAME'),
+        os.environ.get('OFFICE_EMAIL', app.config.get('MAIL_DEFAULT_SENDER'))
+    )
 
 def send_email_notification(sale):
-    """Send email notification for receipt sharing"""
-    if not current_app.config.get('MAIL_USERNAME'):
+    """Queue an email notification for receipt sharing
+
+    The sale must already be committed: the worker reloads it by id in its own session.
+    """
+    app = current_app._get_current_object()
+    username, _ = mail_settings(app)
+    if not username:
         raise Exception("Email not configured")
     
-    office_email = os.environ.get('OFFICE_EMAIL', current_app.config.get('MAIL_DEFAULT_SENDER'))
-    
-    msg = Message(
-        subject=f'Receipt Shared - Invoice #{sale.invoice_number}',
-        recipients=[office_email],
-        body=f"""
-        A receipt has been shared for:
-        
-        Invoice Number: {sale.invoice_number}
-        Customer: {sale.customer.name}
-        Item: {sale.inventory_item.item_type}
-        Amount: ${sale.final_price}
-        Payment Method: {sale.payment_method}
-        Sold By: {sale.sold_by_user.username}
-        Date: {sale.sale_date.strftime('%Y-%m-%d %H:%M')}
-        
-        Please confirm payment receipt in the reconciliation system.
-        """
-    )
+    return EMAIL_EXECUTOR.submit(_send_email_worker, app, sale.id)
+
+def _send_email_worker(app, sale_id):
+    """Build and send the receipt notification for sale_id inside an app context"""
+    with app.app_context():
+        try:
+            sale = Sale.query.get(sale_id)
+            if sale is None:
+                return
+            
+            _, office_email = mail_settings(app)
+            
+            body = "\n".join([
+                "A receipt has been shared for:",
+                "",
+                f"Invoice Number: {sale.invoice_number}",
+                f"Customer: {sale.customer.name}",
+                f"Item: {sale.inventory_item.item_type}",
+                f"Amount: ${sale.final_price}",
+                f"Payment Method: {sale.payment_method}",
+                f"Sold By: {sale.sold_by_user.username}",
+                f"Date: {sale.sale_date.strftime('%Y-%m-%d %H:%M')}",
+                "",
+                "Please confirm payment receipt in the reconciliation system.",
+            ])
+            
+            msg = Message(
+                subject=f'Receipt Shared - Invoice #{sale.invoice_number}',
+                recipients=[office_email],
+                body=body
+            )
+            
+            mail.send(msg)
+        except Exception:
+            # Nobody waits on the future, so failures would otherwise vanish
+            current_app.logger.exception("Failed to send receipt notification for sale %s", sale_id)
+
+# Report aggregates are cached per process for a short TTL. Any committed change to
+# the models they read bumps the data version, which invalidates every entry at once.
+REPORT_CACHE_TTL = 60  # seconds
+REPORT_CACHE_MAX_ENTRIES = 128
+REPORT_SOURCE_MODELS = (Sale, SaleItem, InventoryItem, User)
+_report_cache = {}
+_report_data_version = 0
+
+def cached_report_data(key, build):
+    """Return build() for key, reusing a result computed within the TTL and since the last data change"""
+    now = time.monotonic()
+    entry = _report_cache.get(key)
+    if entry and entry[0] == _report_data_version and now - entry[1] < REPORT_CACHE_TTL:
+        return entry[2]
     
-    mail.send(msg)
+    # Tag the result with the version it was built from; a commit landing mid-build must not be masked
+    version = _report_data_version
+    value = build()
+    if len(_report_cache) >= REPORT_CACHE_MAX_ENTRIES:
+        _report_cache.clear()
+    _report_cache[key] = (version, now, value)
+    return value
+
+@event.listens_for(Session, 'after_flush')
+def _flag_report_changes(session, flush_context):
+    """Remember that this transaction touched data the reports read"""
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, REPORT_SOURCE_MODELS):
+            session.info['report_data_changed'] = True
+            return
+
+@event.listens_for(Session, 'do_orm_execute')
+def _flag_report_bulk_changes(orm_execute_state):
+    """Bulk INSERT/UPDATE/DELETE statements bypass the flush, so flag them here"""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['report_data_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_report_cache(session):
+    global _report_data_version
+    if session.info.pop('report_data_changed', False):
+        _report_data_version += 1
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_report_changes(session):
+    session.info.pop('report_data_changed', None)
 
 def format_currency(amount):
     """Format decimal amount as currency"""
@@ -70,43 +190,51 @@ def calculate_profit(sale_price, purchase_cost, discount_percentage=0):
 
 def calculate_business_profit(selling_price, purchase_cost, overhead_percentage=30):
     """Calculate profit after deducting overhead (labor, storage, etc.)"""
-    gross_profit = float(selling_price) - float(purchase_cost)
-    overhead_cost = float(selling_price) * (overhead_percentage / 100)
+    selling_price = float(selling_price)
+    gross_profit = selling_price - float(purchase_cost)
+    overhead_cost = selling_price * (overhead_percentage / 100)
     net_profit = gross_profit - overhead_cost
     return net_profit
 
 def calculate_actual_discount_percentage(retail_price, selling_price):
     """Calculate the actual discount percentage between retail and selling price"""
-    if not retail_price or float(retail_price) <= 0:
+    if not retail_price:
+        return 0
+    retail_price = float(retail_price)
+    if retail_price <= 0:
         return 0
-    discount_amount = float(retail_price) - float(selling_price)
+    discount_amount = retail_price - float(selling_price)
     if discount_amount <= 0:
         return 0
-    return (discount_amount / float(retail_price)) * 100
+    return (discount_amount / retail_price) * 100
+
+FILE_ICONS = {
+    'photo': 'fas fa-image',
+    'video': 'fas fa-video',
+    'document': 'fas fa-file-pdf'
+}
+
+PAYMENT_STATUS_BADGE_CLASSES = {
+    'pending': 'badge-warning',
+    'received': 'badge-success',
+    'reconciled': 'badge-primary'
+}
+
+ROLE_DISPLAY_NAMES = {
+    'intake_staff': 'Intake Staff',
+    'sales_staff': 'Sales Staff',
+    'office_admin': 'Office Admin'
+}
 
 def get_file_icon(file_type):
     """Get appropriate icon class for file type"""
-    icons = {
-        'photo': 'fas fa-image',
-        'video': 'fas fa-video',
-        'document': 'fas fa-file-pdf'
-    }
-    return icons.get(file_type, 'fas fa-file')
+    return FILE_ICONS.get(file_type, 'fas fa-file')
 
 def get_payment_status_badge_class(status):
     """Get Bootstrap badge class for payment status"""
-    classes = {
-        'pending': 'badge-warning',
-        'received': 'badge-success',
-        'reconciled': 'badge-primary'
-    }
-    return classes.get(status, 'badge-secondary')
+    return PAYMENT_STATUS_BADGE_CLASSES.get(status, 'badge-secondary')
 
 def get_role_display_name(role):
     """Get user-friendly role name"""
-    roles = {
-        'intake_staff': 'Intake Staff',
-        'sales_staff': 'Sales Staff',
-        'office_admin': 'Office Admin'
-    }
-    return roles.get(role, role.replace('_', ' ').title())
+    name = ROLE_DISPLAY_NAMES.get(role)
+    return name if name is not None else role.replace('_', ' ').title()